@@ -1,25 +1,59 @@
 # app/__init__.py
+import os
+
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
+from sqlalchemy import select
 from config import Config
 
 # Global DB objects so other modules can import them
 db = SQLAlchemy()
-migrate = Migrate()
 login_manager = LoginManager()
 
+# flask_migrate pulls in all of Alembic, which web workers never use,
+# so the Migrate object is only created when something asks for it
+_migrate = None
+
+
+def _get_migrate():
+    global _migrate
+    if _migrate is None:
+        from flask_migrate import Migrate
+        _migrate = Migrate()
+    return _migrate
+
+
+def __getattr__(name):
+    # keeps `from app import migrate` working without importing Alembic up front
+    if name == "migrate":
+        return _get_migrate()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def create_app():
     """Application factory: creates and configures the Flask app."""
     app = Flask(__name__)
     app.config.from_object(Config)
 
+    # Faster JSON encoding for jsonify() (e.g. /api/recommend)
+    from .json_provider import ORJSONProvider
+    app.json = ORJSONProvider(app)
+
     # Attach DB + migrations to this app
+    # (connection pool sizing lives in Config.SQLALCHEMY_ENGINE_OPTIONS)
     db.init_app(app)
-    migrate.init_app(app, db)
     login_manager.init_app(app)
 
+    # Only the `flask` CLI (which sets FLASK_RUN_FROM_CLI) needs `flask db ...`;
+    # gunicorn workers skip importing Alembic entirely
+    if (
+        os.environ.get("FLASK_RUN_FROM_CLI") == "true"
+        or os.environ.get("RUN_MIGRATIONS_AT_BOOT") == "1"
+    ):
+        _get_migrate().init_app(app, db)
+
     # where to redirect if a non-logged-in user hits @login_required
     login_manager.login_view = "main.login"   # 'main' = blueprint name, 'login' = function name
 
@@ -28,13 +62,67 @@ def create_app():
     @login_manager.user_loader
     def load_user(user_id):
         from .models import User
-        return User.query.get(int(user_id))
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        # Role (permission checks) and preference (/recommend) come back in the
+        # same SELECT as the user, so neither is a second query per request
+        return db.session.get(
+            User,
+            user_id,
+            options=[db.joinedload(User.role), db.joinedload(User.preference)],
+        )
+
+    # Tables are created once per deploy via `flask init-db`, not on every
+    # worker boot. INIT_DB=1 keeps the old create-on-boot behaviour for local
+    # runs. Schema changes still go through `flask db upgrade`.
+    if os.environ.get("INIT_DB") == "1":
+        with app.app_context():
+            db.create_all()
+
+    @app.cli.command("init-db")
+    def init_db():
+        """Create all database tables, seed the fixed roles and stamp the
+        migrations at head (run once on a fresh database)."""
+        from flask_migrate import stamp
+        from .models import Role
 
-    with app.app_context():
         db.create_all()
+        for name, description in (("user", "Normal user"), ("admin", "Administrator")):
+            if db.session.execute(select(Role.id).where(Role.name == name)).first() is None:
+                db.session.add(Role(name=name, description=description))
+        db.session.commit()
+        # create_all() already built the head schema; without the stamp a later
+        # `flask db upgrade` would replay every migration against it
+        stamp(revision="head")
+        click.echo("Database tables created.")
 
     from .routes import bp as main_bp
     app.register_blueprint(main_bp)
 
+    # Background thread that batches SearchLog inserts off the request path
+    from .services import log_writer
+    log_writer.init_app(app)
+
+    # Load the recommender at boot so no user request pays for it. Skipped for
+    # `flask ...` CLI commands and when PRELOAD_MODELS=0 (e.g. tests); then the
+    # first recommend_topk() call loads it instead.
+    if (
+        os.environ.get("PRELOAD_MODELS", "1") == "1"
+        and os.environ.get("FLASK_RUN_FROM_CLI") != "true"
+    ):
+        from .services.recommender import ensure_models_loaded
+        try:
+            ensure_models_loaded()
+        except Exception:
+            # e.g. dataset missing: keep serving; /recommend reports the error
+            app.logger.exception("Could not preload the recommender")
+
+    # Compile every template once per worker so the first request doesn't pay for it
+    if not app.debug:
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+
     return app
 
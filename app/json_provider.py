@@ -0,0 +1,25 @@
+# app/json_provider.py
+import orjson
+from flask.json.provider import JSONProvider
+
+_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+class ORJSONProvider(JSONProvider):
+    """
+    Flask JSON provider backed by orjson (C/Rust) instead of the stdlib json.
+    jsonify() responses are encoded straight to bytes with no str round-trip.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=_OPTIONS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=_OPTIONS),
+            mimetype="application/json",
+        )
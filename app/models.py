@@ -2,6 +2,7 @@
 from datetime import datetime
 from . import db
 from flask_login import UserMixin
+from sqlalchemy import event, inspect
 
 
 # --------------------
@@ -16,10 +17,19 @@ class SearchLog(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     query = db.Column(db.String(300), nullable=False)        # what the user typed
+    query_norm = db.Column(db.String(300))                   # lower-cased, whitespace-collapsed query
+    query_hash = db.Column(db.BigInteger)                    # 64-bit hash of query_norm (search_query_counts key)
     results_count = db.Column(db.Integer, default=0)         # how many items we showed
     top_text = db.Column(db.Text)                            # short preview of top result (optional)
     latency_ms = db.Column(db.Integer)                       # request latency (ms)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    cache_hit = db.Column(db.Boolean)                        # served from the results cache?
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # ORDER BY created_at DESC LIMIT n for "recent searches" (scanned backwards),
+        # and the created_at range of the windowed analytics count/avg
+        db.Index("ix_search_logs_created_id", "created_at", "id"),
+    )
 
     def __repr__(self):
         return f"<SearchLog {self.query[:30]}...>"
@@ -36,7 +46,7 @@ class Role(db.Model):
     name = db.Column(db.String(50), unique=True, nullable=False)  # "admin", "student", "supervisor"
     description = db.Column(db.String(255))
 
-    users = db.relationship("User", back_populates="role", lazy="dynamic")
+    users = db.relationship("User", back_populates="role")
 
     def __repr__(self):
         return f"<Role {self.name}>"
@@ -55,7 +65,9 @@ class User(UserMixin, db.Model):
     full_name = db.Column(db.String(120), nullable=False)
 
     role_id = db.Column(db.Integer, db.ForeignKey("roles.id"), nullable=False)
-    role = db.relationship("Role", back_populates="users")
+    # role_id is NOT NULL, so an INNER JOIN is safe; the role comes back in
+    # the same SELECT as the user instead of a second lazy load
+    role = db.relationship("Role", back_populates="users", lazy="joined", innerjoin=True)
 
     # Optional fields depending on role
     matric_no = db.Column(db.String(30), unique=True)   # for students
@@ -63,28 +75,54 @@ class User(UserMixin, db.Model):
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    # Denormalised copy of role.name == "admin" so permission checks never touch roles
+    is_admin = db.Column(db.Boolean, default=False, nullable=False, index=True)
+
+    __table_args__ = (
+        # Case-insensitive uniqueness + lookups on lower(email); the plain
+        # unique constraint on email is case-sensitive on Postgres
+        db.Index("ix_users_email_lower", db.func.lower(email), unique=True),
+    )
 
     # Relationships
     supervised_projects = db.relationship(
         "Project",
         back_populates="supervisor",
         foreign_keys="Project.supervisor_id",
-        lazy="dynamic",
     )
     projects = db.relationship(
         "Project",
         back_populates="student",
         foreign_keys="Project.student_id",
-        lazy="dynamic",
     )
 
-    submissions = db.relationship("Submission", back_populates="user", lazy="dynamic")
+    submissions = db.relationship("Submission", back_populates="user")
+    # Append-only and unbounded, so never loaded as a whole collection
     activity_logs = db.relationship("ActivityLog", back_populates="user", lazy="dynamic")
 
     def __repr__(self):
         return f"<User {self.email}>"
 
 
+@event.listens_for(db.session, "before_flush")
+def _sync_is_admin(session, flush_context, instances):
+    # Keep is_admin in step with the role at flush time, whether the role was
+    # assigned through User.role or straight through User.role_id
+    for obj in session.new | session.dirty:
+        if not isinstance(obj, User):
+            continue
+        state = inspect(obj)
+        role_changed = state.attrs.role.history.has_changes()
+        if not (role_changed or state.attrs.role_id.history.has_changes() or obj in session.new):
+            continue
+        if role_changed or obj.role_id is None:
+            role = obj.role
+        else:
+            with session.no_autoflush:
+                role = session.get(Role, obj.role_id)
+        obj.is_admin = role is not None and role.name == "admin"
+
+
 # --------------------
 # 4. Projects
 # --------------------
@@ -120,8 +158,8 @@ class Project(db.Model):
         onupdate=datetime.utcnow,
     )
 
-    submissions = db.relationship("Submission", back_populates="project", lazy="dynamic")
-    evaluations = db.relationship("Evaluation", back_populates="project", lazy="dynamic")
+    submissions = db.relationship("Submission", back_populates="project")
+    evaluations = db.relationship("Evaluation", back_populates="project")
 
     def __repr__(self):
         return f"<Project {self.title}>"
@@ -150,7 +188,7 @@ class Submission(db.Model):
     project = db.relationship("Project", back_populates="submissions")
     user = db.relationship("User", back_populates="submissions")
 
-    evaluations = db.relationship("Evaluation", back_populates="submission", lazy="dynamic")
+    evaluations = db.relationship("Evaluation", back_populates="submission")
 
     def __repr__(self):
         return f"<Submission {self.type} - Project {self.project_id}>"
@@ -226,6 +264,8 @@ class UserPreference(db.Model):
 
     # Comma-separated list of topics e.g. "Stress,Anxiety,Sleep"
     topics = db.Column(db.String(255))
+    # Same topics space-separated, written on save so /recommend can use it as-is
+    topics_joined = db.Column(db.String(512))
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(
@@ -242,3 +282,25 @@ class UserPreference(db.Model):
     def __repr__(self):
         return f"<UserPreference user_id={self.user_id} topics={self.topics}>"
 
+
+
+# --------------------
+# 9. Search Query Counts (analytics summary)
+# --------------------
+
+class SearchQueryAggregate(db.Model):
+    """
+    One row per distinct query, kept up to date by the search log writer.
+    Lets "top queries" read a small table instead of grouping all of SearchLog.
+    """
+    __tablename__ = "search_query_counts"
+
+    # Keyed on the 8-byte hash of the normalized query (see SearchLog.query_hash);
+    # query is the first spelling seen, for display
+    query_hash = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    query = db.Column(db.String(300), nullable=False)
+    n = db.Column(db.BigInteger, nullable=False, default=0, index=True)
+    last_seen = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<SearchQueryAggregate {self.query[:30]} n={self.n}>"
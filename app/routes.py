@@ -1,7 +1,17 @@
 # app/routes.py
+import functools
+import hashlib
+import os
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from cachetools import TTLCache
 from flask import (
     Blueprint,
+    current_app,
     render_template,
     request,
     jsonify,
@@ -16,15 +26,163 @@ from flask_login import (
     login_required,
     current_user,
 )
-from werkzeug.security import generate_password_hash, check_password_hash
-
-from .services.recommender import ensure_models_loaded, recommend_topk
-from .models import SearchLog, User, Role, UserPreference
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from config import PASSWORD_HASH_MEMORY_KIB, PASSWORD_HASH_TIME_COST
+
+from .models import SearchLog, SearchQueryAggregate, User, Role, UserPreference
+from .services.log_writer import enqueue_log
+from .services.text import normalize_query
 from . import db
-from sqlalchemy import func, desc
+from sqlalchemy import desc, func, select
 
 bp = Blueprint("main", __name__)
 
+# Argon2id with an explicit, deploy-tunable cost instead of the library default;
+# the C extension releases the GIL while hashing, so other threads keep serving
+_ph = PasswordHasher(
+    time_cost=PASSWORD_HASH_TIME_COST,
+    memory_cost=PASSWORD_HASH_MEMORY_KIB,
+    parallelism=1,
+)
+
+
+def _hash_password(password):
+    return _ph.hash(password)
+
+
+def _verify_password(password_hash, password):
+    """
+    Check a password against an Argon2 hash, or a legacy Werkzeug hash
+    for accounts created before the switch.
+    """
+    if not password_hash.startswith("$argon2"):
+        return check_password_hash(password_hash, password)
+    try:
+        return _ph.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def _needs_rehash(password_hash):
+    return not password_hash.startswith("$argon2") or _ph.check_needs_rehash(password_hash)
+
+
+# Bounds on request inputs so a single request can't force a huge top-k sort
+# (queries also have to fit SearchLog.query, a VARCHAR(300))
+MAX_TOPK = 50
+MAX_QUERY_LENGTH = 300
+
+
+# User-Agents whose /api/recommend calls are served but not logged
+BOT_RE = re.compile(r"bot|crawl|spider|curl|python-requests", re.I)
+
+
+def _parse_topk(value, default=5):
+    """Parse ?topk / form topk, falling back to the default and clamping to [1, MAX_TOPK]."""
+    try:
+        topk = int(value)
+    except (TypeError, ValueError):
+        topk = default
+    return max(1, min(topk, MAX_TOPK))
+
+
+# Recent results per (query, topk), so repeated popular searches skip the
+# similarity search entirely. Per process, like the rest of the recommender state.
+_reco_cache = TTLCache(maxsize=1024, ttl=300)
+_reco_lock = threading.Lock()
+
+# Similarity searches run on a bounded pool (one thread per CPU) with a
+# deadline, so a pathological query can't pin the request thread indefinitely
+RECOMMEND_TIMEOUT = 5  # seconds
+RECOMMEND_WORKERS = os.cpu_count() or 1
+_reco_pool = ThreadPoolExecutor(max_workers=RECOMMEND_WORKERS, thread_name_prefix="recommend")
+# Searches queued or running at once; beyond this, fail fast instead of queueing
+# behind work whose callers may already have timed out
+RECOMMEND_MAX_PENDING = 4 * RECOMMEND_WORKERS
+_reco_slots = threading.BoundedSemaphore(RECOMMEND_MAX_PENDING)
+RECOMMEND_RETRY_AFTER = 1  # seconds, sent with the 503 when every slot is taken
+
+
+class RecommenderBusy(Exception):
+    """Every search slot is taken, so this one was turned away without running."""
+
+
+@functools.cache
+def _recommender():
+    """
+    The recommender module, imported on first use so pages that never recommend
+    don't pull in the ML stack. Its invalidate() also clears _reco_cache.
+    """
+    from .services import recommender
+    recommender.on_invalidate(clear_results_cache)
+    return recommender
+
+
+def _recommend_cached(query, topk):
+    """
+    recommend_topk() behind a small TTL cache keyed on the normalized query,
+    so "Stress", "stress" and " stress " share one entry.
+    Returns (results, cache_hit). Raises RecommenderBusy when every search slot
+    is taken and TimeoutError when the search misses RECOMMEND_TIMEOUT.
+    """
+    q_norm = normalize_query(query)  # TF-IDF ranks both forms identically
+    key = (q_norm, topk)
+    with _reco_lock:
+        results = _reco_cache.get(key)
+    if results is not None:
+        return results, True
+
+    if not _reco_slots.acquire(blocking=False):
+        raise RecommenderBusy()
+    try:
+        future = _reco_pool.submit(_recommender().recommend_topk, q_norm, topk)
+    except BaseException:
+        _reco_slots.release()
+        raise
+    future.add_done_callback(lambda _: _reco_slots.release())  # also runs on cancel
+    try:
+        results = future.result(timeout=RECOMMEND_TIMEOUT)
+    except TimeoutError:
+        future.cancel()  # still queued: drop it rather than run it for nobody
+        raise
+    with _reco_lock:
+        _reco_cache[key] = results
+    return results, False
+
+
+def clear_results_cache():
+    """Drop cached results (registered with recommender.on_invalidate())."""
+    with _reco_lock:
+        _reco_cache.clear()
+
+
+def _reco_etag(query, topk, dataset_version):
+    """Weak ETag for an /api/recommend response (same inputs as the results cache)."""
+    key = f"{normalize_query(query)}|{topk}|{dataset_version}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _cacheable(response, etag):
+    response.set_etag(etag, weak=True)
+    response.cache_control.public = True
+    response.cache_control.max_age = 300  # matches the results cache TTL
+    return response
+
+
+# Analytics page payload per ?days window (admin dashboards get polled)
+_analytics_cache = TTLCache(maxsize=16, ttl=30)
+_analytics_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=8)
+def _role_id_by_name(name):
+    """Role ids are fixed once created, so resolve each name once per process."""
+    return db.session.execute(
+        select(Role.id).where(Role.name == name)
+    ).scalar_one_or_none()
+
 
 # ---------------------------
 # Public pages
@@ -55,23 +213,27 @@ def register():
             flash("Please fill in all fields.", "danger")
             return redirect(url_for("main.register"))
 
-        # Check existing email
-        if User.query.filter_by(email=email).first():
+        # Check existing email (EXISTS; no need to load the row)
+        if db.session.execute(
+            select(select(User.id).where(func.lower(User.email) == email).exists())
+        ).scalar():
             flash("Email is already registered.", "danger")
             return redirect(url_for("main.register"))
 
-        # Get or create 'user' role
-        user_role = Role.query.filter_by(name="user").first()
-        if not user_role:
+        # Get or create 'user' role (normally seeded by `flask init-db`)
+        user_role_id = _role_id_by_name("user")
+        if user_role_id is None:
+            _role_id_by_name.cache_clear()  # don't keep the cached miss
             user_role = Role(name="user", description="Normal user")
             db.session.add(user_role)
-            db.session.commit()
+            db.session.flush()  # assigns the id; committed together with the user below
+            user_role_id = user_role.id
 
         new_user = User(
             email=email,
             full_name=name,
-            password_hash=generate_password_hash(password),
-            role=user_role,
+            password_hash=_hash_password(password),
+            role_id=user_role_id,
         )
         db.session.add(new_user)
         db.session.commit()
@@ -91,12 +253,23 @@ def login():
         email = (request.form.get("email") or "").strip().lower()
         password = request.form.get("password") or ""
 
-        user = User.query.filter_by(email=email).first()
+        # Only the columns needed to check the password; the full User is
+        # loaded (by primary key) once the password is known to be right
+        row = db.session.execute(
+            select(User.id, User.password_hash).where(func.lower(User.email) == email)
+        ).first()
 
-        if not user or not check_password_hash(user.password_hash, password):
+        if not row or not _verify_password(row.password_hash, password):
             flash("Invalid email or password.", "danger")
             return redirect(url_for("main.login"))
 
+        user = db.session.get(User, row.id)
+
+        # Upgrade legacy / outdated hashes while we have the plain password
+        if _needs_rehash(user.password_hash):
+            user.password_hash = _hash_password(password)
+            db.session.commit()
+
         login_user(user)
         flash("Logged in successfully.", "success")
         return redirect(url_for("main.index"))
@@ -134,21 +307,19 @@ def recommend_page():
     if request.method == "POST":
         # Read form inputs safely
         query = (request.form.get("query") or "").strip()
-        try:
-            topk = int(request.form.get("topk") or 5)
-        except ValueError:
-            topk = 5  # fallback
+        topk = _parse_topk(request.form.get("topk"))
 
         # Build effective query using preferences (for cold-start)
         effective_query = query
 
         pref_topics = ""
+        pref_terms = ""
         if current_user.is_authenticated and getattr(current_user, "preference", None):
             pref_topics = current_user.preference.topics or ""
+            pref_terms = current_user.preference.topics_joined or ""
 
         # If user has preferences, weave them into the query
-        if pref_topics:
-            pref_terms = pref_topics.replace(",", " ")
+        if pref_terms:
             if effective_query:
                 # boost user preferences on top of their explicit query
                 effective_query = f"{effective_query} {pref_terms}"
@@ -157,32 +328,33 @@ def recommend_page():
                 effective_query = pref_terms
                 used_prefs_only = True
 
-        if effective_query:
+        if len(query) > MAX_QUERY_LENGTH:
+            load_error = f"Query is too long (max {MAX_QUERY_LENGTH} characters)."
+        elif effective_query:
             try:
                 # Measure how long the recommendation takes
+                # (dataset/model are loaded at app startup, see create_app)
                 t0 = time.perf_counter()
 
-                # Make sure dataset/model are ready
-                ensure_models_loaded()
-
-                # Get top-k recommendations
-                results = recommend_topk(effective_query, topk)
+                # Get top-k recommendations (cached for repeated queries; the
+                # effective query already carries the preference terms)
+                results, cache_hit = _recommend_cached(effective_query, topk)
 
                 latency_ms = int((time.perf_counter() - t0) * 1000)
 
-                # Short preview of the top result (for analytics)
-                top_text = (results[0]["text"][:120] + "…") if results else None
-
                 # Log only the original query text (what user actually typed)
-                log = SearchLog(
-                    query=query if query else f"[prefs:{pref_topics}]",
-                    results_count=len(results or []),
-                    top_text=top_text,
-                    latency_ms=latency_ms,
-                )
-                db.session.add(log)
-                db.session.commit()  # actually write to the DB
-
+                enqueue_log({
+                    "query": query if query else f"[prefs:{pref_topics}]",
+                    "results_count": len(results or []),
+                    "top_text": results[0]["text"] if results else None,  # trimmed by the writer
+                    "latency_ms": latency_ms,
+                    "cache_hit": cache_hit,
+                })
+
+            except RecommenderBusy:
+                load_error = "The recommender is busy, please try again in a moment."
+            except TimeoutError:
+                load_error = "The search took too long, please try again."
             except Exception as e:
                 # Any error (e.g. dataset missing) -> show friendly message
                 load_error = str(e)
@@ -207,34 +379,44 @@ def api_recommend():
     Also logs each call into SearchLog, same as the web form.
     """
     query = (request.args.get("query") or "").strip()
-    try:
-        topk = int(request.args.get("topk", 5))
-    except ValueError:
-        topk = 5
+    topk = _parse_topk(request.args.get("topk"))
 
     if not query:
         return jsonify({"error": "query is required"}), 400
+    if len(query) > MAX_QUERY_LENGTH:
+        return jsonify({"error": "query too long"}), 400
+
+    recommender = _recommender()
+
+    # Results only change with the dataset, so clients/CDNs can revalidate
+    # with If-None-Match and get a 304 without any recommender work
+    if recommender.dataset_version is not None:
+        etag = _reco_etag(query, topk, recommender.dataset_version)
+        if request.if_none_match.contains_weak(etag):
+            return _cacheable(current_app.response_class(status=304), etag)
 
     try:
         t0 = time.perf_counter()
-        ensure_models_loaded()
-        results = recommend_topk(query, topk)
+        results, cache_hit = _recommend_cached(query, topk)
         latency_ms = int((time.perf_counter() - t0) * 1000)
 
-        top_text = (results[0]["text"][:120] + "…") if results else None
-
-        # Log the API call
-        log = SearchLog(
-            query=query,
-            results_count=len(results or []),
-            top_text=top_text,
-            latency_ms=latency_ms,
-        )
-        db.session.add(log)
-        db.session.commit()
-
-        return jsonify(results)
-
+        # Log the API call (but not bots/scripts, which would swamp the analytics)
+        if not BOT_RE.search(request.headers.get("User-Agent", "")):
+            enqueue_log({
+                "query": query,
+                "results_count": len(results or []),
+                "top_text": results[0]["text"] if results else None,
+                "latency_ms": latency_ms,
+                "cache_hit": cache_hit,
+            })
+
+        etag = _reco_etag(query, topk, recommender.dataset_version)
+        return _cacheable(jsonify(results), etag)
+
+    except RecommenderBusy:
+        return jsonify({"error": "recommender is busy"}), 503, {"Retry-After": str(RECOMMEND_RETRY_AFTER)}
+    except TimeoutError:
+        return jsonify({"error": "recommendation timed out"}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -243,58 +425,91 @@ def api_recommend():
 # Admin analytics (protected)
 # ---------------------------
 
+def _analytics_payload(cutoff):
+    """Totals, top queries and recent logs for the analytics page."""
+    # Number of logged searches + average latency (ms) in the window, one round-trip
+    total, avg_latency = db.session.execute(
+        select(
+            func.count(SearchLog.id),
+            func.coalesce(func.avg(SearchLog.latency_ms), 0),
+        ).where(SearchLog.created_at >= cutoff)
+    ).one()
+
+    # Top queries among those seen in the window, ranked by their all-time count
+    # (the per-query summary table keeps running totals, not per-window ones)
+    top_queries = (
+        db.session.execute(
+            select(SearchQueryAggregate.query, SearchQueryAggregate.n)
+            .where(SearchQueryAggregate.last_seen >= cutoff)
+            .order_by(desc(SearchQueryAggregate.n))
+            .limit(10)
+        )
+        .all()
+    )
+
+    # Most recent 20 log entries, only the displayed columns (plain rows, no
+    # ORM objects to hydrate; the template reads them by the same names)
+    recent = db.session.execute(
+        select(
+            SearchLog.created_at,
+            SearchLog.query,
+            SearchLog.results_count,
+            SearchLog.latency_ms,
+            SearchLog.top_text,
+        )
+        .order_by(desc(SearchLog.created_at))
+        .limit(20)
+    ).all()
+
+    return {
+        "total": int(total or 0),
+        "avg_latency": int(avg_latency or 0),
+        "top_queries": top_queries,
+        "recent": recent,
+    }
+
+
 @bp.route("/admin/analytics")
 @login_required
 def analytics():
     """
     Simple analytics page.
-    Shows totals, average latency, top queries, and recent logs.
+    Shows totals, average latency, top queries (over the last ?days=N days),
+    and recent logs.
     Only accessible to admin users.
     """
     # Check role: must be admin
-    if not current_user.role or current_user.role.name != "admin":
+    if not current_user.is_admin:
         abort(403)
 
-    error = None
-    total = 0
-    avg_latency = 0
-    top_queries = []
-    recent = []
-
+    # Aggregates cover a bounded window (?days=N, 1-365) so they stay an
+    # index range scan instead of growing with the whole log
     try:
-        # Total number of logged searches
-        total = db.session.query(func.count(SearchLog.id)).scalar() or 0
-
-        # Average latency (ms)
-        avg_latency = db.session.query(func.avg(SearchLog.latency_ms)).scalar() or 0
-
-        # Top queries (grouped by query text)
-        top_queries = (
-            db.session.query(SearchLog.query, func.count(SearchLog.id).label("n"))
-            .group_by(SearchLog.query)
-            .order_by(desc("n"))
-            .limit(10)
-            .all()
-        )
+        days = int(request.args.get("days", 30))
+    except ValueError:
+        days = 30
+    days = max(1, min(days, 365))
+    cutoff = datetime.utcnow() - timedelta(days=days)
 
-        # Most recent 20 log entries
-        recent = (
-            db.session.query(SearchLog)
-            .order_by(desc(SearchLog.created_at))
-            .limit(20)
-            .all()
-        )
+    # The whole page payload is reused for up to 30s per window size
+    error = None
+    with _analytics_lock:
+        payload = _analytics_cache.get(days)
 
-    except Exception as e:
-        # If anything fails (e.g. DB issue), capture it and display on the page
-        error = str(e)
+    if payload is None:
+        try:
+            payload = _analytics_payload(cutoff)
+            with _analytics_lock:
+                _analytics_cache[days] = payload
+        except Exception as e:
+            # If anything fails (e.g. DB issue), capture it and display on the page
+            error = str(e)
+            payload = {"total": 0, "avg_latency": 0, "top_queries": [], "recent": []}
 
     return render_template(
         "analytics.html",
-        total=int(total or 0),
-        avg_latency=int(avg_latency or 0),
-        top_queries=top_queries,
-        recent=recent,
+        **payload,
+        days=days,
         error=error,   # pass the error (if any) to the template
     )
 
@@ -311,7 +526,9 @@ def profile():
     Preferences are stored in UserPreference (one row per user).
     """
     # Ensure a preference row exists for this user
-    pref = UserPreference.query.filter_by(user_id=current_user.id).first()
+    pref = db.session.execute(
+        select(UserPreference).where(UserPreference.user_id == current_user.id)
+    ).scalar_one_or_none()
     if not pref:
         pref = UserPreference(user_id=current_user.id, topics="")
         db.session.add(pref)
@@ -342,6 +559,7 @@ def profile():
         # Update preferences (checkboxes)
         selected_topics = request.form.getlist("topics")  # list of strings
         pref.topics = ",".join(selected_topics)
+        pref.topics_joined = " ".join(selected_topics)  # ready to append to a query
 
         db.session.commit()
         flash("Profile & preferences updated.", "success")
@@ -374,7 +592,7 @@ def change_password():
         confirm_pw = request.form.get("confirm_password") or ""
 
         # 1. Check current password
-        if not check_password_hash(current_user.password_hash, current_pw):
+        if not _verify_password(current_user.password_hash, current_pw):
             flash("Current password is incorrect.", "danger")
             return redirect(url_for("main.change_password"))
 
@@ -389,7 +607,7 @@ def change_password():
             return redirect(url_for("main.change_password"))
 
         # 4. Save new password
-        current_user.password_hash = generate_password_hash(new_pw)
+        current_user.password_hash = _hash_password(new_pw)
         db.session.commit()
 
         flash("Password updated successfully.", "success")
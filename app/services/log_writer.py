@@ -0,0 +1,173 @@
+# app/services/log_writer.py
+"""
+Background writer for SearchLog rows.
+
+Request handlers call enqueue_log(); a daemon thread drains the queue and
+writes rows in batches (one executemany INSERT + one COMMIT per batch), so
+no DB round-trip sits on the request path.
+"""
+import atexit
+import hashlib
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from .. import db
+from ..models import SearchLog, SearchQueryAggregate
+from .text import normalize_query
+
+BATCH_SIZE = 200      # max rows per INSERT/COMMIT
+FLUSH_INTERVAL = 1.0  # seconds to wait for a batch to fill up
+MAX_PENDING = 10_000  # rows are dropped (not blocked on) beyond this
+
+_queue = queue.Queue(maxsize=MAX_PENDING)
+_app = None
+_thread = None
+_thread_pid = None
+_thread_lock = threading.Lock()
+
+
+def query_hash(query: str) -> int:
+    """Signed 64-bit hash of the (normalized) query text (fits a BIGINT column)."""
+    digest = hashlib.blake2b(query.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def _preview(text, n=120):
+    """Short preview of the top result for analytics (done on the writer thread)."""
+    if text is None:
+        return None
+    text = str(text)
+    return text[:n] + "…" if len(text) > n else text
+
+
+def init_app(app):
+    """Remember the app for the writer's app context and start the thread."""
+    global _app
+    if _app is None:
+        atexit.register(flush)
+    _app = app
+    _ensure_thread()
+
+
+def enqueue_log(row: dict):
+    """
+    Queue one SearchLog row (a dict of column values) for the writer.
+    created_at is stamped here so batching doesn't shift the logged time;
+    top_text may be the full text, the writer trims it to a preview.
+    """
+    row.setdefault("created_at", datetime.utcnow())
+    row.setdefault("query_norm", normalize_query(row["query"]))
+    row.setdefault("query_hash", query_hash(row["query_norm"]))
+
+    _ensure_thread()
+    try:
+        _queue.put_nowait(row)
+    except queue.Full:
+        # Analytics only: never make a request wait on the log writer
+        _app.logger.warning("Search log queue full; dropping row")
+
+
+def flush():
+    """Write everything still queued (used at interpreter exit)."""
+    while True:
+        batch = []
+        try:
+            while len(batch) < BATCH_SIZE:
+                batch.append(_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not batch:
+            return
+        _write(batch)
+
+
+def _ensure_thread():
+    # Threads don't survive fork (e.g. gunicorn --preload), so restart per process
+    global _thread, _thread_pid
+    if _thread_pid == os.getpid():
+        return
+    with _thread_lock:
+        if _thread_pid != os.getpid():
+            _thread = threading.Thread(target=_run, name="searchlog-writer", daemon=True)
+            _thread.start()
+            _thread_pid = os.getpid()
+
+
+def _run():
+    while True:
+        _write(_collect())
+
+
+def _collect():
+    """Block for the first row, then gather up to BATCH_SIZE within FLUSH_INTERVAL."""
+    batch = [_queue.get()]
+    deadline = time.monotonic() + FLUSH_INTERVAL
+    while len(batch) < BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _write(rows):
+    """Insert a batch of SearchLog rows and update the query counts in one COMMIT."""
+    for row in rows:
+        row["top_text"] = _preview(row.get("top_text"))
+
+    with _app.app_context():
+        try:
+            # Core-style executemany: no ORM objects or unit-of-work bookkeeping
+            db.session.execute(insert(SearchLog), rows)
+            _upsert_query_counts(rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            _app.logger.exception("Failed to write %d search logs", len(rows))
+        finally:
+            db.session.remove()
+
+
+def _upsert_query_counts(rows):
+    """Add a batch of log rows to the per-query summary table."""
+    counts = {}
+    for row in rows:
+        query, n, last_seen = counts.get(row["query_hash"], (row["query"], 0, row["created_at"]))
+        counts[row["query_hash"]] = (query, n + 1, max(last_seen, row["created_at"]))
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        # No portable upsert; fall back to read-modify-write
+        for qhash, (query, n, last_seen) in counts.items():
+            agg = db.session.get(SearchQueryAggregate, qhash)
+            if agg is None:
+                agg = SearchQueryAggregate(query_hash=qhash, query=query, n=0)
+                db.session.add(agg)
+            agg.n += n
+            agg.last_seen = last_seen
+        return
+
+    stmt = upsert(SearchQueryAggregate).values([
+        {"query_hash": qhash, "query": query, "n": n, "last_seen": last_seen}
+        for qhash, (query, n, last_seen) in counts.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SearchQueryAggregate.query_hash],
+        set_={
+            "n": SearchQueryAggregate.n + stmt.excluded.n,
+            "last_seen": stmt.excluded.last_seen,
+        },
+    )
+    db.session.execute(stmt)
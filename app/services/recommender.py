@@ -1,13 +1,58 @@
+import heapq
+import json
+import threading
 from pathlib import Path
+from operator import itemgetter
+from typing import NamedTuple
+import numpy as np
 import pandas as pd
-import joblib
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
-from config import DATA_DIR
+from cachetools import LRUCache
+from joblib import Parallel, delayed
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import normalize
+from sklearn.utils import murmurhash3_32
+from config import DATA_DIR, RECOMMEND_CHUNK_ROWS
+from .text import normalize_query
+
+try:
+    from pyarrow import csv as pacsv  # optional: multithreaded CSV parsing
+except ImportError:
+    pacsv = None
+
+try:
+    from numba import njit  # optional: compiles the posting-list scoring loop
+except ImportError:
+    njit = None
+
+# Built artifacts (no pickles): settings as JSON, idf weights as .npy, the
+# TF-IDF matrix as an uncompressed .npz and the result columns as Parquet
+MODEL_PATH = DATA_DIR / "tfidf_model.json"
+IDF_PATH = DATA_DIR / "tfidf_idf.npy"
+MATRIX_PATH = DATA_DIR / "tfidf_matrix.npz"
+DATA_PATH = DATA_DIR / "cleaned_dataset.parquet"
+# Only the text column and these (when present) are kept after loading the CSV:
+# nothing else is read at query time, so nothing else is persisted or held in memory
+RESULT_COLUMNS = ["title", "id", "label", "category"]  # copied into results when present
+OCCURRENCES_COL = "_occurrences"  # rows in the CSV sharing each (deduplicated) text
+N_FEATURES = 2 ** 20  # hashed term buckets (no vocabulary is kept)
+BATCH_BLOCK = 64  # queries per sparse product in recommend_batch
+HEAP_ROWS_PER_POSTING = 16  # dict + heap scoring below 1 posting per 16 corpus rows
+
+# Small, dense corpora are scored with BLAS on a dense column-major copy instead
+DENSE_MAX_ROWS = 50_000
+DENSE_MIN_DENSITY = 0.02       # over the features the corpus actually uses
+DENSE_MAX_BYTES = 256 * 2**20
+
+# pd.read_csv's default missing-value strings, so the Arrow reader treats
+# empty/"NA" cells (text ones included) exactly like the pandas fallback
+CSV_NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+    "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
 
 # Look for common filenames and finally any CSV in Dataset/
-VECT_PATH = DATA_DIR / "tfidf_vectorizer.pkl"
-DATA_PATH = DATA_DIR / "cleaned_dataset.pkl"    # pickled DataFrame
 COMMON_CSV_NAMES = [
     "data.csv",
     "cleaned_dataset.csv",
@@ -15,10 +60,30 @@ COMMON_CSV_NAMES = [
     "items.csv",
 ]
 
-_vectorizer = None
-_df = None
-_matrix = None
-_text_col = None
+class ModelState(NamedTuple):
+    """Everything a query needs, loaded once and never mutated."""
+    vectorizer: object   # query text -> TF-IDF row (hasher + idf)
+    matrix: object       # unit-length float32 CSR rows
+    matrix_csc: object   # same matrix by column: term -> (rows, weights) posting lists
+    text_col: str
+    extras: list         # RESULT_COLUMNS present in the data
+    cols: dict           # {column: NumPy array} for the text and extra columns
+    occurrences: object  # CSV rows sharing each row's text
+    version: str         # content hash of the corpus
+    analyzer: object     # the hasher's tokenizer (lowercase, token regex, stop words)
+    idf: object          # float32 idf weight per hashed feature
+    dense: object = None       # Fortran-ordered float32 rows x used features, if small/dense
+    dense_cols: object = None  # sorted feature ids of dense's columns
+
+_loaded = None
+_load_lock = threading.Lock()
+dataset_version = None  # fingerprint of the loaded corpus (used for API ETags)
+_invalidate_callbacks = []  # run by invalidate(), e.g. to drop the views' results cache
+
+# Rankings per (corpus version, query, k). Keyed on the version so a search
+# still running on an old model can never fill in rows for a new one.
+_topk_cache = LRUCache(maxsize=4096)
+_topk_lock = threading.Lock()
 
 def _find_csv_path() -> Path:
     # 1) Try common names
@@ -31,8 +96,8 @@ def _find_csv_path() -> Path:
     if csvs:
         return csvs[0]
     raise FileNotFoundError(
-        f"No CSV found in {DATA_DIR}. Put a CSV there (e.g. data.csv) or provide PKLs: "
-        f"{VECT_PATH.name} and {DATA_PATH.name}."
+        f"No CSV found in {DATA_DIR}. Put a CSV there (e.g. data.csv) or provide the built "
+        f"files: {MODEL_PATH.name}, {IDF_PATH.name}, {MATRIX_PATH.name} and {DATA_PATH.name}."
     )
 
 def _detect_text_column(df: pd.DataFrame) -> str:
@@ -48,58 +113,389 @@ def _detect_text_column(df: pd.DataFrame) -> str:
         f"Couldn't find a suitable text column in CSV. Columns: {list(df.columns)}"
     )
 
+def _kept_columns(df, text_col):
+    extra = RESULT_COLUMNS + [OCCURRENCES_COL]
+    return [text_col] + [c for c in extra if c in df.columns and c != text_col]
+
+def _read_csv(csv_path: Path) -> pd.DataFrame:
+    """Parse with Arrow's multithreaded reader when available, else pandas."""
+    if pacsv is not None:
+        try:
+            table = pacsv.read_csv(
+                csv_path,
+                read_options=pacsv.ReadOptions(use_threads=True),
+                convert_options=pacsv.ConvertOptions(
+                    null_values=CSV_NULL_VALUES, strings_can_be_null=True
+                ),
+            )
+            return table.to_pandas(self_destruct=True)
+        except Exception:
+            pass  # stricter than pandas on malformed files: let pandas try
+    return pd.read_csv(csv_path)
+
+def _as_text_iter(s: pd.Series):
+    """The column's values as strings, converting only if it isn't text already."""
+    return s.to_numpy() if pd.api.types.is_string_dtype(s) else s.astype(str).to_numpy()
+
+def _make_hasher(n_features=N_FEATURES):
+    # Raw term counts (no sign flipping, no norm): TfidfTransformer weights and normalizes
+    return HashingVectorizer(
+        n_features=n_features,
+        alternate_sign=False,
+        norm=None,
+        stop_words="english",
+        dtype=np.float32,
+    )
+
 def _build_from_csv():
     csv_path = _find_csv_path()
-    df = pd.read_csv(csv_path)
+    df = _read_csv(csv_path)
     text_col = _detect_text_column(df)
-    df = df.dropna(subset=[text_col]).reset_index(drop=True)
+    # In place, without a reset_index copy: rows are only ever addressed by position
+    df.dropna(subset=[text_col], inplace=True)
+    df = df[_kept_columns(df, text_col)]
+
+    # Identical texts would get identical rows: keep the first of each (with its
+    # extra columns) and count the copies, so duplicates don't crowd the top-k
+    copies = df[text_col].value_counts(sort=False)
+    df = df.drop_duplicates(subset=[text_col])
+    df[OCCURRENCES_COL] = df[text_col].map(copies).to_numpy()
 
-    vec = TfidfVectorizer(stop_words="english")
-    mat = vec.fit_transform(df[text_col].astype(str))
+    # Hashed term counts + idf: same weights as TfidfVectorizer, without a vocabulary dict
+    hasher = _make_hasher()
+    counts = hasher.transform(_as_text_iter(df[text_col]))
+    tfidf = TfidfTransformer().fit(counts)
+    mat = tfidf.transform(counts)
+    vec = make_pipeline(hasher, tfidf)
 
     # Persist for faster next runs (optional but handy)
     try:
-        joblib.dump(vec, VECT_PATH)
-        joblib.dump(df, DATA_PATH)
+        _save_built(df, vec, mat, text_col)
     except Exception:
         # do not fail the request if saving is not possible
         pass
 
     return df, vec, mat, text_col
 
+def _save_built(df, vec, mat, text_col):
+    """Write the settings/idf, matrix and result columns for the next start."""
+    hasher, tfidf = vec[0], vec[-1]
+    MODEL_PATH.write_text(json.dumps({
+        "text_col": text_col,
+        "n_features": hasher.n_features,
+    }))
+    np.save(IDF_PATH, tfidf.idf_)
+    sparse.save_npz(MATRIX_PATH, mat.tocsr(), compressed=False)
+    df.to_parquet(DATA_PATH, index=False)
+
+def _load_built():
+    """Inverse of _save_built(): rebuild the hasher + idf transformer."""
+    meta = json.loads(MODEL_PATH.read_text())
+    tfidf = TfidfTransformer()
+    tfidf.idf_ = np.load(IDF_PATH)
+    vec = make_pipeline(_make_hasher(meta["n_features"]), tfidf)
+    mat = sparse.load_npz(MATRIX_PATH)
+    df = pd.read_parquet(DATA_PATH)
+    df = df[_kept_columns(df, meta["text_col"])]  # older files may carry more
+    return df, vec, mat, meta["text_col"]
+
+def _load_state() -> ModelState:
+    """Load the built vectorizer/matrix/data if present; otherwise build from CSV."""
+    if all(p.exists() for p in (MODEL_PATH, IDF_PATH, MATRIX_PATH, DATA_PATH)):
+        df, vectorizer, matrix, text_col = _load_built()
+    else:
+        df, vectorizer, matrix, text_col = _build_from_csv()
+
+    # Plain arrays for result assembly (fancy-indexed per query, no per-row Series)
+    extras = [c for c in RESULT_COLUMNS if c in df.columns]
+    cols = {c: df[c].to_numpy() for c in [text_col] + extras}
+    if OCCURRENCES_COL in df.columns:
+        occurrences = df[OCCURRENCES_COL].to_numpy()
+    else:
+        occurrences = np.ones(len(df), dtype=np.int64)  # built before deduplication
+
+    # Unit-length float32 CSR rows: cosine similarity is then a single sparse
+    # mat-vec, moving half the bytes of float64 (ranking doesn't need the precision)
+    matrix = _compact(normalize(matrix.tocsr().astype(np.float32, copy=False), norm="l2", copy=False))
+
+    # Content hash, so every worker (and every restart) agrees on the version
+    version = format(int(pd.util.hash_pandas_object(df[text_col], index=False).sum()), "x")
+
+    # Hash buckets no document uses get the *largest* fitted idf; zero them so
+    # unknown query words drop out (as TfidfVectorizer's vocabulary did) instead
+    # of inflating the query norm and deflating every score
+    matrix_csc = _compact(matrix.tocsc())
+    tfidf = vectorizer[-1]
+    tfidf.idf_ = np.where(np.diff(matrix_csc.indptr) > 0, tfidf.idf_, 0.0)
+
+    # Pieces of the vectorizer, so single queries skip the general transform() path
+    analyzer = vectorizer[0].build_analyzer()
+    idf = tfidf.idf_.astype(np.float32)
+
+    dense, dense_cols = _dense_copy(matrix)
+    return ModelState(
+        vectorizer, matrix, matrix_csc, text_col, extras, cols, occurrences, version,
+        analyzer, idf, dense, dense_cols,
+    )
+
+def _compact(m):
+    """Sorted indices and int32 index arrays where they fit (half the bytes of int64)."""
+    m.sort_indices()
+    if m.nnz < 2**31 - 1 and max(m.shape) < 2**31 - 1:
+        m.indices = m.indices.astype(np.int32, copy=False)
+        m.indptr = m.indptr.astype(np.int32, copy=False)
+    return m
+
+def _dense_copy(matrix):
+    """
+    (dense, dense_cols) for corpora small and dense enough that BLAS beats the
+    sparse kernels, else (None, None). Only the used feature columns are kept
+    (hashing leaves most empty), column-major so a query's columns are contiguous.
+    """
+    dense_cols = np.unique(matrix.indices)
+    n_rows = matrix.shape[0]
+    if n_rows == 0 or dense_cols.size == 0 or n_rows >= DENSE_MAX_ROWS or n_rows * dense_cols.size * 4 > DENSE_MAX_BYTES:
+        return None, None
+    if matrix.nnz / (n_rows * dense_cols.size) <= DENSE_MIN_DENSITY:
+        return None, None
+    return np.asfortranarray(matrix[:, dense_cols].toarray(), dtype=np.float32), dense_cols
+
+def _state() -> ModelState:
+    """The loaded model, loading it on first use (exactly once, even across threads)."""
+    global _loaded, dataset_version
+    state = _loaded
+    if state is None:
+        with _load_lock:
+            if _loaded is None:
+                _loaded = _load_state()
+                dataset_version = _loaded.version
+            state = _loaded
+    return state
+
 def ensure_models_loaded():
-    """Load vectorizer+data from PKL if present; otherwise build from CSV."""
-    global _vectorizer, _df, _matrix, _text_col
-
-    if _vectorizer is not None and _df is not None and _matrix is not None:
-        return
-
-    if VECT_PATH.exists() and DATA_PATH.exists():
-        _vectorizer = joblib.load(VECT_PATH)
-        _df = joblib.load(DATA_PATH)
-        # infer text column
-        _text_col = _detect_text_column(_df)
-        _matrix = _vectorizer.transform(_df[_text_col].astype(str))
+    """Load the model now (e.g. at app startup) rather than on the first query."""
+    _state()
+
+def _select_topk(idx, sims, k):
+    """Keep the k best (idx, sims) pairs, unordered."""
+    if sims.size > k:
+        keep = np.argpartition(sims, -k)[-k:]
+        idx, sims = idx[keep], sims[keep]
+    return idx, sims
+
+def _merge_topk(best_idx, best_sims, part, offset, k):
+    """Fold one block of scores (rows offset..) into the running top-k, skipping zeros."""
+    nz = np.flatnonzero(part)
+    idx = np.concatenate([best_idx, nz + offset])
+    sims = np.concatenate([best_sims, part[nz]])
+    return _select_topk(idx, sims, k)
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _accumulate_postings(indptr, indices, data, q_idx, q_data, out):
+        for t in range(q_idx.size):
+            j = q_idx[t]
+            w = q_data[t]
+            for p in range(indptr[j], indptr[j + 1]):
+                out[indices[p]] += data[p] * w
+else:
+    _accumulate_postings = None
+
+def _score_postings(st, q_idx, q_vals):
+    """
+    Inverted-index scoring: walk only the posting lists of the query's terms.
+    Returns (rows, sims) for the rows sharing at least one term with the query.
+    """
+    indptr, indices, data = st.matrix_csc.indptr, st.matrix_csc.indices, st.matrix_csc.data
+    if _accumulate_postings is not None:
+        # One compiled loop over all postings into a dense score vector
+        out = np.zeros(st.matrix_csc.shape[0], dtype=data.dtype)
+        _accumulate_postings(indptr, indices, data, q_idx, q_vals, out)
+        rows = np.flatnonzero(out)
+        return rows, out[rows]
+
+    rows = [indices[indptr[j]:indptr[j + 1]] for j in q_idx]
+    vals = [data[indptr[j]:indptr[j + 1]] * w for j, w in zip(q_idx, q_vals)]
+    rows, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+    return rows, np.bincount(inverse, weights=np.concatenate(vals))
+
+def _topk_postings_heap(st, q_idx, q_vals, k):
+    """
+    Posting-list scoring into a {row: score} dict, then heapq.nlargest: O(M log k)
+    for M touched rows, with no corpus-sized array at all. For very short lists.
+    """
+    indptr, indices, data = st.matrix_csc.indptr, st.matrix_csc.indices, st.matrix_csc.data
+    acc = {}
+    for j, w in zip(q_idx.tolist(), q_vals.tolist()):
+        lo, hi = indptr[j], indptr[j + 1]
+        for row, v in zip(indices[lo:hi].tolist(), data[lo:hi].tolist()):
+            acc[row] = acc.get(row, 0.0) + v * w
+    top = heapq.nlargest(k, acc.items(), key=itemgetter(1))
+    return (
+        np.fromiter((row for row, _ in top), dtype=np.intp, count=len(top)),
+        np.fromiter((sim for _, sim in top), dtype=np.float32, count=len(top)),
+    )
+
+_EMPTY = np.empty(0)
+_EMPTY.flags.writeable = False
+
+def _topk_indices(st, query: str, k: int):
+    """(row indices, scores) of st's k best matches, best first. Cached per (version, query, k)."""
+    key = (st.version, query, k)
+    with _topk_lock:
+        cached = _topk_cache.get(key)
+    if cached is None:
+        cached = _rank(st, query, k)
+        with _topk_lock:
+            _topk_cache[key] = cached
+    return cached
+
+def _rank(st, query, k):
+    """Uncached _topk_indices(): picks the cheapest scoring path for this query."""
+    q_idx, q_vals = _vectorize_query(st, query)
+    if q_idx.size == 0:
+        return _EMPTY, _EMPTY  # no known terms: nothing is similar, skip the scan entirely
+    n_rows = st.matrix.shape[0]
+
+    if st.dense is not None:
+        # Small dense corpus: one BLAS mat-vec over just the query's columns
+        pos = np.minimum(np.searchsorted(st.dense_cols, q_idx), st.dense_cols.size - 1)
+        known = st.dense_cols[pos] == q_idx  # terms the corpus never uses score 0
+        sims = st.dense[:, pos[known]] @ q_vals[known]
+        top_idx, top_sims = _merge_topk(np.empty(0, dtype=np.intp), _EMPTY, sims, 0, k)
+        return _ordered(top_idx, top_sims)
+
+    # Short queries touch few rows: score just their posting lists when those
+    # are no bigger than one dense score vector, otherwise scan the corpus.
+    # The shortest lists go through a dict + heap instead of array kernels.
+    indptr = st.matrix_csc.indptr
+    n_postings = int((indptr[q_idx + 1] - indptr[q_idx]).sum())
+    if n_postings * HEAP_ROWS_PER_POSTING <= n_rows:
+        top_idx, top_sims = _topk_postings_heap(st, q_idx, q_vals, k)
+    elif n_postings <= n_rows:
+        top_idx, top_sims = _select_topk(*_score_postings(st, q_idx, q_vals), k)
     else:
-        _df, _vectorizer, _matrix, _text_col = _build_from_csv()
+        # Score the corpus a block of rows at a time, keeping only the best k
+        # so far, so memory stays bounded however large the corpus grows
+        q_col = sparse.csc_matrix(
+            (q_vals, (q_idx, np.zeros_like(q_idx))), shape=(st.matrix.shape[1], 1)
+        )
+        top_idx = np.empty(0, dtype=np.intp)
+        top_sims = np.empty(0, dtype=st.matrix.dtype)
+        for start in range(0, n_rows, RECOMMEND_CHUNK_ROWS):
+            part = (st.matrix[start:start + RECOMMEND_CHUNK_ROWS] @ q_col).toarray().ravel()
+            top_idx, top_sims = _merge_topk(top_idx, top_sims, part, start, k)
+    return _ordered(top_idx, top_sims)
 
-def recommend_topk(query: str, k: int = 5):
-    ensure_models_loaded()
-    q_vec = _vectorizer.transform([query])
-    sims = linear_kernel(q_vec, _matrix).ravel()
-    top_idx = sims.argsort()[-k:][::-1]
+def _ordered(top_idx, top_sims):
+    """Best first (only the k kept need ordering), read-only as they're shared via the cache."""
+    order = np.argsort(-top_sims)
+    top_idx, top_sims = top_idx[order], top_sims[order]
+    top_idx.flags.writeable = top_sims.flags.writeable = False
+    return top_idx, top_sims
+
+def invalidate():
+    """Forget the loaded model and cached rankings; the next query reloads from disk."""
+    global _loaded, dataset_version
+    with _load_lock:
+        _loaded = None
+        dataset_version = None
+        with _topk_lock:
+            _topk_cache.clear()
+        callbacks = list(_invalidate_callbacks)
+    for callback in callbacks:
+        callback()
+
+def on_invalidate(callback):
+    """Have invalidate() also call callback() (e.g. to drop a results cache built on this one)."""
+    with _load_lock:
+        if callback not in _invalidate_callbacks:
+            _invalidate_callbacks.append(callback)
+
+def _feature_index(token, n_features):
+    # HashingVectorizer's bucket for a token (signed murmurhash3, seed 0)
+    h = murmurhash3_32(token, seed=0)
+    if h == -2**31:
+        return (2**31 - 1 - (n_features - 1)) % n_features
+    return abs(h) % n_features
+
+def _vectorize_query(st, query):
+    """
+    One query's TF-IDF row as (feature ids, unit-length float32 weights): the
+    precomputed analyzer + idf, with no sparse matrix built per query.
+    """
+    n_features = st.matrix.shape[1]
+    counts = {}
+    for token in st.analyzer(query):
+        j = _feature_index(token, n_features)
+        counts[j] = counts.get(j, 0) + 1
+    q_idx = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+    q_vals = np.fromiter(counts.values(), dtype=np.float32, count=len(counts)) * st.idf[q_idx]
+    known = q_vals > 0  # words in no document have idf 0: leave them out of the norm
+    q_idx, q_vals = q_idx[known], q_vals[known]
+    if q_idx.size:
+        q_vals /= np.sqrt(np.dot(q_vals, q_vals))
+    return q_idx, q_vals
+
+def _vectorize(st, queries):
+    """Unit-length float32 TF-IDF rows for a list of (normalized) queries."""
+    q_vecs = st.vectorizer.transform(queries).astype(np.float32, copy=False)
+    q_vecs.eliminate_zeros()  # unknown words (idf 0) must not count toward the norm
+    return normalize(q_vecs, norm="l2", copy=False)
+
+def _results(st, top_idx, top_sims):
+    """Result dicts for ranked row indices."""
+    top_idx = np.asarray(top_idx, dtype=np.intp)
+    texts = st.cols[st.text_col][top_idx]
+    extras = {c: st.cols[c][top_idx] for c in st.extras}
+    occurrences = st.occurrences[top_idx]
 
     results = []
-    for i, idx in enumerate(top_idx, start=1):
-        row = _df.iloc[int(idx)]
-        score = float(sims[int(idx)])
+    for i, (text, score) in enumerate(zip(texts, top_sims)):
         item = {
-            "rank": i,
-            "score": round(score, 6),
-            "text": str(row.get(_text_col, "")),
+            "rank": i + 1,
+            "score": round(float(score), 6),
+            "text": str(text),
+            "occurrences": int(occurrences[i]),  # identical texts are ranked once
         }
-        for extra in ["title", "id", "label", "category"]:
-            if extra in _df.columns:
-                item[extra] = row.get(extra)
+        for c in st.extras:
+            item[c] = extras[c][i]
         results.append(item)
     return results
+
+def recommend_topk(query: str, k: int = 5):
+    st = _state()
+    # Equivalent spellings share a cache entry
+    return _results(st, *_topk_indices(st, normalize_query(query), k))
+
+def _rank_block(st, q_vecs, k):
+    """Top-k (indices, scores) for each query row in one sparse-sparse product."""
+    sims = (q_vecs @ st.matrix.T).tocsr()  # only nonzero scores are stored
+    ranked = []
+    for r in range(sims.shape[0]):
+        lo, hi = sims.indptr[r], sims.indptr[r + 1]
+        top_idx, top_sims = _select_topk(sims.indices[lo:hi], sims.data[lo:hi], k)
+        order = np.argsort(-top_sims)
+        ranked.append((top_idx[order], top_sims[order]))
+    return ranked
+
+def recommend_batch(queries: list[str], k: int = 5):
+    """
+    recommend_topk() for many queries at once: the queries are stacked into one
+    sparse matrix and scored with a single product per block of BATCH_BLOCK
+    queries, blocks running on threads (scipy releases the GIL while multiplying).
+    Returns one result list per query, in order.
+    """
+    st = _state()
+    if not queries:
+        return []
+    q_vecs = _vectorize(st, [normalize_query(q) for q in queries])
+    blocks = [q_vecs[i:i + BATCH_BLOCK] for i in range(0, q_vecs.shape[0], BATCH_BLOCK)]
+    if len(blocks) == 1:
+        ranked = _rank_block(st, blocks[0], k)
+    else:
+        parts = Parallel(n_jobs=-1, prefer="threads")(
+            delayed(_rank_block)(st, block, k) for block in blocks
+        )
+        ranked = [r for part in parts for r in part]
+    return [_results(st, top_idx, top_sims) for top_idx, top_sims in ranked]
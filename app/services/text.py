@@ -0,0 +1,10 @@
+# app/services/text.py
+"""
+Query text helpers shared by the views, the log writer and the recommender
+(kept free of DB and ML imports so any of them can use it).
+"""
+
+
+def normalize_query(query: str) -> str:
+    """Lower-case and collapse whitespace, so "Stress" and " stress " match."""
+    return " ".join(query.lower().split())
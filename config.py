@@ -2,8 +2,45 @@
 from pathlib import Path
 import os
 
+from sqlalchemy.pool import NullPool
+
 BASE_DIR = Path(__file__).resolve().parent
-DATA_DIR = BASE_DIR / "Dataset"  # <- where your CSV/PKL live
+DATA_DIR = BASE_DIR / "Dataset"  # <- where your CSV (and the built TF-IDF files) live
+
+# Corpus rows scored per block in recommend_topk (bounds per-query memory)
+RECOMMEND_CHUNK_ROWS = int(os.environ.get("RECOMMEND_CHUNK_ROWS", 8192))
+
+# Argon2id password-hashing cost. Tune per host so one hash takes ~50ms;
+# existing hashes are upgraded to the new cost on the user's next login.
+PASSWORD_HASH_TIME_COST = int(os.environ.get("PASSWORD_HASH_TIME_COST", 2))
+PASSWORD_HASH_MEMORY_KIB = int(os.environ.get("PASSWORD_HASH_MEMORY_KIB", 19456))
+
+
+def _engine_options(database_uri):
+    """
+    Engine/pool settings. Size the pool to at least gunicorn's --threads per
+    worker, plus one for the search-log writer thread; set DB_NULLPOOL=1 on
+    serverless hosts so no idle connections are kept.
+    """
+    options = {
+        "query_cache_size": 1200,  # keep compiled statements (e.g. the log INSERT) cached
+    }
+    if database_uri.startswith("sqlite"):
+        return options  # SQLite keeps its own pool defaults
+
+    if os.environ.get("DB_NULLPOOL") == "1":
+        options["poolclass"] = NullPool
+        return options
+
+    options.update(
+        pool_size=int(os.environ.get("DB_POOL_SIZE", 20)),
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 20)),
+        pool_pre_ping=True,   # drop stale connections instead of failing a request
+        pool_recycle=1800,    # seconds; stay under managed-Postgres idle timeouts
+        pool_timeout=5,       # fail fast rather than queue forever on checkout
+    )
+    return options
+
 
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret")
@@ -13,3 +50,4 @@ class Config:
         f"sqlite:///{BASE_DIR / 'fyp.db'}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False  # avoid noisy warnings
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI)
@@ -0,0 +1,28 @@
+"""Add analytics indexes to search_logs
+
+Revision ID: 5b1f3c9d2e47
+Revises: 0cca4ca84269
+Create Date: 2026-10-15 09:12:41.302118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f3c9d2e47'
+down_revision = '0cca4ca84269'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('search_logs', schema=None) as batch_op:
+        batch_op.drop_index('ix_search_logs_created_at')
+        batch_op.create_index('ix_search_logs_created_id', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('search_logs', schema=None) as batch_op:
+        batch_op.drop_index('ix_search_logs_created_id')
+        batch_op.create_index('ix_search_logs_created_at', ['created_at'], unique=False)
@@ -0,0 +1,26 @@
+"""Add cache_hit to search_logs
+
+Revision ID: 7f3c2d9a8e15
+Revises: e6f2b8c4a713
+Create Date: 2026-10-15 12:48:10.226583
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f3c2d9a8e15'
+down_revision = 'e6f2b8c4a713'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('search_logs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cache_hit', sa.Boolean(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('search_logs', schema=None) as batch_op:
+        batch_op.drop_column('cache_hit')
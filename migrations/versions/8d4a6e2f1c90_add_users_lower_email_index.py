@@ -0,0 +1,24 @@
+"""Add case-insensitive unique index on users.email
+
+Revision ID: 8d4a6e2f1c90
+Revises: 5b1f3c9d2e47
+Create Date: 2026-10-15 10:03:17.845230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4a6e2f1c90'
+down_revision = '5b1f3c9d2e47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_users_email_lower', table_name='users')
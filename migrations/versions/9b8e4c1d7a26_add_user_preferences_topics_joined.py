@@ -0,0 +1,28 @@
+"""Add topics_joined to user_preferences
+
+Revision ID: 9b8e4c1d7a26
+Revises: 7f3c2d9a8e15
+Create Date: 2026-10-15 14:05:43.671208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b8e4c1d7a26'
+down_revision = '7f3c2d9a8e15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_preferences', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('topics_joined', sa.String(length=512), nullable=True))
+
+    op.execute("UPDATE user_preferences SET topics_joined = REPLACE(topics, ',', ' ')")
+
+
+def downgrade():
+    with op.batch_alter_table('user_preferences', schema=None) as batch_op:
+        batch_op.drop_column('topics_joined')
@@ -0,0 +1,38 @@
+"""Add is_admin flag to users
+
+Revision ID: c3e7a91b5d28
+Revises: 8d4a6e2f1c90
+Create Date: 2026-10-15 10:41:52.117394
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e7a91b5d28'
+down_revision = '8d4a6e2f1c90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ALTER TABLE (not batch mode): a SQLite batch rebuild of users would
+    # silently drop the expression index ix_users_email_lower
+    op.add_column('users', sa.Column('is_admin', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.create_index(op.f('ix_users_is_admin'), 'users', ['is_admin'], unique=False)
+
+    # Backfill from the existing role assignments
+    op.execute(
+        "UPDATE users SET is_admin = TRUE "
+        "WHERE role_id IN (SELECT id FROM roles WHERE name = 'admin')"
+    )
+
+
+def downgrade():
+    op.drop_index(op.f('ix_users_is_admin'), table_name='users')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('is_admin')
+    # The batch rebuild above loses the expression index on SQLite; restore it
+    if op.get_bind().dialect.name == 'sqlite':
+        op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], unique=True)
@@ -0,0 +1,96 @@
+"""Add query_norm/query_hash to search_logs and create the search_query_counts summary keyed on the hash
+
+Revision ID: e6f2b8c4a713
+Revises: c3e7a91b5d28
+Create Date: 2026-10-15 11:20:08.562941
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6f2b8c4a713'
+down_revision = 'c3e7a91b5d28'
+branch_labels = None
+depends_on = None
+
+# Rows backfilled per round trip
+BATCH_SIZE = 5000
+
+
+def _normalize_query(query):
+    # Frozen copy of app.services.text.normalize_query
+    return " ".join(query.lower().split())
+
+
+def _query_hash(query):
+    # Frozen copy of app.services.log_writer.query_hash
+    digest = hashlib.blake2b(query.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def upgrade():
+    with op.batch_alter_table('search_logs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('query_norm', sa.String(length=300), nullable=True))
+        batch_op.add_column(sa.Column('query_hash', sa.BigInteger(), nullable=True))
+
+    # Backfill query_norm and its hash in primary-key batches (there is no index on query)
+    bind = op.get_bind()
+    search_logs = sa.table(
+        'search_logs',
+        sa.column('id', sa.Integer),
+        sa.column('query', sa.String),
+        sa.column('query_norm', sa.String),
+        sa.column('query_hash', sa.BigInteger),
+    )
+    update = (
+        search_logs.update()
+        .where(search_logs.c.id == sa.bindparam('row_id'))
+        .values(query_norm=sa.bindparam('row_norm'), query_hash=sa.bindparam('row_hash'))
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(search_logs.c.id, search_logs.c.query)
+            .where(search_logs.c.id > last_id)
+            .order_by(search_logs.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        params = []
+        for id_, query in rows:
+            query_norm = _normalize_query(query)
+            params.append({'row_id': id_, 'row_norm': query_norm, 'row_hash': _query_hash(query_norm)})
+        bind.execute(update, params)
+        last_id = rows[-1][0]
+
+    op.create_table('search_query_counts',
+    sa.Column('query_hash', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('query', sa.String(length=300), nullable=False),
+    sa.Column('n', sa.BigInteger(), nullable=False),
+    sa.Column('last_seen', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('query_hash')
+    )
+    with op.batch_alter_table('search_query_counts', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_search_query_counts_n'), ['n'], unique=False)
+
+    # Seed the summary from the existing log; variants of one query share a row
+    op.execute(
+        "INSERT INTO search_query_counts (query_hash, query, n, last_seen) "
+        "SELECT query_hash, min(query), count(*), max(created_at) FROM search_logs GROUP BY query_hash"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('search_query_counts', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_search_query_counts_n'))
+
+    op.drop_table('search_query_counts')
+
+    with op.batch_alter_table('search_logs', schema=None) as batch_op:
+        batch_op.drop_column('query_hash')
+        batch_op.drop_column('query_norm')